@@ -1,11 +1,23 @@
-import requests
+import aiohttp
+import asyncio
+import orjson
 import time
-import json
 import os
-import glob
+import pickle
+import re
+import tempfile
+from collections import OrderedDict
 from typing import List, Dict
 import logging
 
+from aiolimiter import AsyncLimiter
+from pybloom_live import ScalableBloomFilter
+
+from config import BALANCE_CACHE_SIZE, MAX_RETRIES
+
+# Matches batch address files, e.g. addresses_3.txt (not addresses_with_balance_3.txt)
+_ADDR_FILE_RE = re.compile(r'^addresses_(\d+)\.txt$')
+
 class BlockchainScanner:
     def __init__(self):
         # Create data directory if it doesn't exist
@@ -13,7 +25,13 @@ class BlockchainScanner:
             os.makedirs('data')
             
         self.progress_file = "data/progress.json"
+        self.seen_filter_file = "data/seen.bloom"
         self.data_dir = "data"
+
+        # Bound template factories: one format call per path, no
+        # f-string rebuild in the hot paths
+        self._addr_path = os.path.join(self.data_dir, "addresses_{}.txt").format
+        self._bal_path = os.path.join(self.data_dir, "addresses_with_balance_{}.txt").format
         self.current_addresses_file = None
         self.current_balances_file = None
         self.current_block = self.load_progress()
@@ -21,7 +39,16 @@ class BlockchainScanner:
         self.addresses_with_balance = 0
         self.is_running = False
         self.current_file_index = self.get_current_file_index()
-        
+        self.total_file_pairs = len(self._scan_file_indices())
+        self._files_cache = (0.0, None)
+        self.session = None
+        self.semaphore = None
+        self.rate_limiter = None
+        self.balance_cache = OrderedDict()
+        self.seen_addresses = self.load_seen_filter()
+        self._addr_fp = None
+        self._bal_fp = None
+
         # Setup logging
         logging.basicConfig(level=logging.INFO)
         self.logger = logging.getLogger(__name__)
@@ -29,94 +56,184 @@ class BlockchainScanner:
         # Initialize current files
         self.initialize_current_files()
 
+    def batch_file_paths(self, file_index: int):
+        """Return the (addresses, balances) file paths for a batch index"""
+        return (self._addr_path(file_index), self._bal_path(file_index))
+
+    @staticmethod
+    def _file_size(file_path: str):
+        """Size in bytes, or None if the file doesn't exist — one stat call"""
+        try:
+            return os.stat(file_path).st_size
+        except FileNotFoundError:
+            return None
+
+    def _scan_file_indices(self) -> List[int]:
+        """List batch indices with a single directory scan, no per-file stat"""
+        indices = []
+        with os.scandir(self.data_dir) as entries:
+            for entry in entries:
+                match = _ADDR_FILE_RE.match(entry.name)
+                if match:
+                    indices.append(int(match.group(1)))
+        return indices
+
     def get_current_file_index(self) -> int:
         """Get the highest existing file index"""
         try:
-            address_files = glob.glob(os.path.join(self.data_dir, "addresses_*.txt"))
-            if not address_files:
-                return 1
-            
-            indices = []
-            for file_path in address_files:
-                try:
-                    filename = os.path.basename(file_path)
-                    index = int(filename.split('_')[1].split('.')[0])
-                    indices.append(index)
-                except (ValueError, IndexError):
-                    continue
-            
+            indices = self._scan_file_indices()
             return max(indices) if indices else 1
-        except Exception as e:
-            self.logger.error(f"Error getting file index: {e}")
+        except OSError as e:
+            print(f"❌ Error getting file index: {e}")
             return 1
 
+    def _open_current_files(self):
+        """Open buffered append handles for the current file pair"""
+        self._close_current_files()
+
+        # Opening in append mode creates the pair on first use; count it
+        # then so total_file_pairs stays authoritative for /stats
+        is_new_pair = self._file_size(self.current_addresses_file) is None
+
+        self._addr_fp = open(self.current_addresses_file, 'a', buffering=1 << 20)
+        self._bal_fp = open(self.current_balances_file, 'a', buffering=1 << 20)
+
+        if is_new_pair:
+            self.total_file_pairs += 1
+            self._invalidate_files_cache()
+
+    def _close_current_files(self):
+        """Flush and close the current file handles"""
+        for fp in (self._addr_fp, self._bal_fp):
+            if fp is not None and not fp.closed:
+                fp.close()
+        self._addr_fp = None
+        self._bal_fp = None
+
     def initialize_current_files(self):
         """Initialize current working files"""
-        self.current_file_index = self.get_current_file_index()
-        self.current_addresses_file = f"data/addresses_{self.current_file_index}.txt"
-        self.current_balances_file = f"data/addresses_with_balance_{self.current_file_index}.txt"
-        
-        # Create files if they don't exist
-        for file_path in [self.current_addresses_file, self.current_balances_file]:
-            try:
-                with open(file_path, 'a'):
-                    pass
-            except FileNotFoundError:
-                with open(file_path, 'w'):
-                    pass
+        # current_file_index is already cached from __init__; only
+        # create_new_files/delete_files change the on-disk layout
+        self.current_addresses_file, self.current_balances_file = \
+            self.batch_file_paths(self.current_file_index)
+
+        # Files are created lazily when a scan opens them in append mode
 
     def create_new_files(self):
         """Create new file pair for next batch"""
         self.current_file_index += 1
-        self.current_addresses_file = f"data/addresses_{self.current_file_index}.txt"
-        self.current_balances_file = f"data/addresses_with_balance_{self.current_file_index}.txt"
-        
-        # Create new empty files
-        for file_path in [self.current_addresses_file, self.current_balances_file]:
-            with open(file_path, 'w'):
-                pass
-        
+        self.current_addresses_file, self.current_balances_file = \
+            self.batch_file_paths(self.current_file_index)
+
+        # Create new empty files; _open_current_files counts the new pair
+        self._open_current_files()
+
         self.logger.info(f"Created new file pair: {self.current_file_index}")
         return self.current_file_index
 
+    def load_seen_filter(self) -> ScalableBloomFilter:
+        """Load the persistent Bloom filter of addresses already queried"""
+        try:
+            with open(self.seen_filter_file, 'rb') as f:
+                return pickle.load(f)
+        except (FileNotFoundError, pickle.UnpicklingError, EOFError):
+            return ScalableBloomFilter(initial_capacity=1000000, error_rate=0.01)
+
+    def save_seen_filter(self):
+        """Persist the seen-address Bloom filter"""
+        with open(self.seen_filter_file, 'wb') as f:
+            pickle.dump(self.seen_addresses, f)
+
     def load_progress(self) -> int:
         """Load progress from file"""
+        self.address_counts = {}
+        self.balance_counts = {}
         try:
-            with open(self.progress_file, 'r') as f:
-                data = json.load(f)
+            with open(self.progress_file, 'rb') as f:
+                data = orjson.loads(f.read())
+                self.address_counts = {int(k): v for k, v in data.get('address_counts', {}).items()}
+                self.balance_counts = {int(k): v for k, v in data.get('balance_counts', {}).items()}
                 return data.get('current_block', 0)
-        except (FileNotFoundError, json.JSONDecodeError):
+        except (FileNotFoundError, orjson.JSONDecodeError):
             return 0
 
     def save_progress(self, block_number: int):
-        """Save current progress"""
+        """Save current progress atomically"""
         progress_data = {
             'current_block': block_number,
             'timestamp': time.time(),
             'total_addresses': self.total_addresses,
             'addresses_with_balance': self.addresses_with_balance,
-            'current_file_index': self.current_file_index
+            'current_file_index': self.current_file_index,
+            'address_counts': self.address_counts,
+            'balance_counts': self.balance_counts
         }
-        with open(self.progress_file, 'w') as f:
-            json.dump(progress_data, f)
 
-    def get_block_data(self, block_height: int) -> Dict:
+        # Write to a temp file and rename over progress.json so a crash
+        # mid-write can't leave a truncated file behind
+        data = orjson.dumps(progress_data, option=orjson.OPT_NON_STR_KEYS)
+        fd, tmp_path = tempfile.mkstemp(dir=self.data_dir)
+        try:
+            os.write(fd, data)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        os.replace(tmp_path, self.progress_file)
+
+        self.save_seen_filter()
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        """Get or create the shared HTTP session"""
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=100, limit_per_host=8, ttl_dns_cache=300)
+            self.session = aiohttp.ClientSession(connector=connector)
+            # Stay polite: at most 8 requests in flight against the API,
+            # paced to 10 requests per 10 seconds with bursts allowed
+            self.semaphore = asyncio.Semaphore(8)
+            self.rate_limiter = AsyncLimiter(10, 10)
+        return self.session
+
+    async def close(self):
+        """Close the shared HTTP session"""
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        self.session = None
+        self.semaphore = None
+        self.rate_limiter = None
+
+    async def _get_json(self, api_url: str, timeout: int) -> Dict:
+        """GET a JSON document over the shared session, retrying with backoff"""
+        session = await self.get_session()
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                async with self.rate_limiter, self.semaphore:
+                    async with session.get(api_url, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                        if response.status == 200:
+                            # orjson parses straight from bytes, skipping the
+                            # bytes->str decode stdlib json would do
+                            return orjson.loads(await response.read())
+                        return None
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if attempt == MAX_RETRIES:
+                    raise
+                await asyncio.sleep(0.3 * (2 ** attempt))
+        return None
+
+    async def get_block_data(self, block_height: int) -> Dict:
         """Get block data from blockchain APIs"""
         api_url = f"https://blockchain.info/block-height/{block_height}?format=json"
-        
+
         try:
-            response = requests.get(api_url, timeout=30)
-            if response.status_code == 200:
-                return response.json()
-        except requests.RequestException as e:
+            return await self._get_json(api_url, timeout=30)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
             self.logger.warning(f"API failed: {e}")
-        
+
         return None
 
     def extract_addresses_from_block(self, block_data: Dict) -> List[str]:
         """Extract all addresses from block transactions"""
-        addresses = set()
-        
+        addresses = []
+
         try:
             if 'blocks' in block_data:
                 blocks = block_data['blocks']
@@ -126,77 +243,182 @@ class BlockchainScanner:
                         for tx in block['tx'][:3]:
                             for output in tx.get('out', []):
                                 if 'addr' in output:
-                                    addresses.add(output['addr'])
+                                    addresses.append(output['addr'])
         except Exception as e:
             self.logger.error(f"Error extracting addresses: {e}")
-            
-        return list(addresses)
 
-    def check_balance(self, address: str) -> float:
+        # Dedup in one pass while preserving first-seen order
+        return list(dict.fromkeys(addresses))
+
+    def _cache_balance(self, address: str, balance: float):
+        """Remember a balance, evicting the least recently used entry when full"""
+        self.balance_cache[address] = balance
+        self.balance_cache.move_to_end(address)
+        if len(self.balance_cache) > BALANCE_CACHE_SIZE:
+            self.balance_cache.popitem(last=False)
+
+    async def check_balance(self, address: str) -> float:
         """Check balance using APIs"""
+        if address in self.balance_cache:
+            self.balance_cache.move_to_end(address)
+            return self.balance_cache[address]
+
         api_url = f"https://blockchain.info/balance?active={address}"
-        
+
         try:
-            response = requests.get(api_url, timeout=10)
-            if response.status_code == 200:
-                data = response.json()
-                if address in data:
-                    balance_data = data[address]
-                    return balance_data.get('final_balance', 0) / 100000000
-        except requests.RequestException:
+            data = await self._get_json(api_url, timeout=10)
+            if data and address in data:
+                balance = data[address].get('final_balance', 0) / 100000000
+                self._cache_balance(address, balance)
+                return balance
+        except (aiohttp.ClientError, asyncio.TimeoutError):
             pass
-                
+
         return 0.0
 
-    def scan_blocks(self, start_block: int, end_block: int = None) -> Dict:
+    async def _check_balance_chunk(self, addresses: List[str]) -> Dict[str, float]:
+        """Check up to 100 balances with a single API call"""
+        balances = {}
+        api_url = f"https://blockchain.info/balance?active={'|'.join(addresses)}"
+
+        try:
+            data = await self._get_json(api_url, timeout=10)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            data = None
+
+        for address in addresses:
+            if data and address in data:
+                balance = data[address].get('final_balance', 0) / 100000000
+                self._cache_balance(address, balance)
+            else:
+                balance = 0.0
+            balances[address] = balance
+
+        return balances
+
+    async def check_balances(self, addresses: List[str]) -> Dict[str, float]:
+        """Check balances for many addresses, serving repeats from cache"""
+        balances = {}
+        missing = []
+        for address in addresses:
+            if address in self.balance_cache:
+                self.balance_cache.move_to_end(address)
+                balances[address] = self.balance_cache[address]
+            else:
+                missing.append(address)
+
+        chunks = [missing[i:i + 100] for i in range(0, len(missing), 100)]
+        for chunk_balances in await asyncio.gather(*[self._check_balance_chunk(c) for c in chunks]):
+            balances.update(chunk_balances)
+
+        return balances
+
+    async def _fetch_block_limited(self, block_height: int, semaphore: asyncio.Semaphore) -> Dict:
+        """Fetch one block while holding a prefetch permit"""
+        # Pacing is handled by the per-request rate limiter; the
+        # semaphore only bounds how many blocks are buffered ahead
+        async with semaphore:
+            return await self.get_block_data(block_height)
+
+    async def scan_blocks(self, start_block: int, end_block: int = None) -> Dict:
         """Scan blocks for addresses and balances"""
         self.is_running = True
         current_block = start_block
-        
+
+        if self._addr_fp is None:
+            self._open_current_files()
+
         if end_block is None:
             end_block = start_block + 20  # Only 20 blocks per run on Render
-        
+
+        # Prefetch up to 16 blocks concurrently; results are consumed in order
+        prefetch = asyncio.Semaphore(16)
+        fetch_tasks = {
+            block: asyncio.create_task(self._fetch_block_limited(block, prefetch))
+            for block in range(start_block, end_block + 1)
+        }
+
+        # Progress is flushed every few blocks, not on every one; a restart
+        # re-scans at most that window and the Bloom filter keeps the
+        # re-scanned writes idempotent
+        last_completed_block = None
+        last_progress_flush = time.monotonic()
+        blocks_since_save = 0
+
         try:
-            while current_block <= end_block and self.is_running:
+            for block in range(start_block, end_block + 1):
+                if not self.is_running:
+                    break
+                current_block = block
                 print(f"🔄 Scanning block {current_block}")
-                
+
                 # Get block data
-                block_data = self.get_block_data(current_block)
+                block_data = await fetch_tasks.pop(block)
                 if not block_data:
                     print(f"⚠️ Could not fetch block {current_block}")
-                    current_block += 1
+                    current_block = block + 1
                     continue
-                
-                # Extract addresses
+
+                # Extract addresses, skipping any already handled this run
                 addresses = self.extract_addresses_from_block(block_data)
+                addresses = [a for a in addresses if a not in self.seen_addresses]
+                for address in addresses:
+                    self.seen_addresses.add(address)
                 print(f"📨 Found {len(addresses)} addresses in block {current_block}")
-                
+
+                # Check all balances for this block, 100 addresses per call
+                balances = await self.check_balances(addresses)
+
                 # Process addresses
+                pending_addresses = []
+                pending_balances = []
                 for address in addresses:
-                    # Save all addresses
-                    with open(self.current_addresses_file, 'a') as f:
-                        f.write(f"{address}\n")
+                    balance = balances.get(address, 0.0)
+                    pending_addresses.append(f"{address}\n")
                     self.total_addresses += 1
-                    
-                    # Check balance and save if has balance
-                    balance = self.check_balance(address)
+
+                    # Save if has balance
                     if balance > 0:
-                        with open(self.current_balances_file, 'a') as f:
-                            f.write(f"{address} - {balance:.8f} BTC\n")
+                        pending_balances.append(f"{address} - {balance:.8f} BTC\n")
                         self.addresses_with_balance += 1
                         print(f"💰 Found balance: {balance} BTC")
-                
-                # Save progress
-                self.save_progress(current_block)
-                current_block += 1
-                
-                # Rate limiting
-                time.sleep(2)
-                
+
+                # One buffered write per block instead of one open/write/close per address
+                index = self.current_file_index
+                if pending_addresses:
+                    self._addr_fp.writelines(pending_addresses)
+                    self._addr_fp.flush()
+                    self.address_counts[index] = self.address_counts.get(index, 0) + len(pending_addresses)
+                if pending_balances:
+                    self._bal_fp.writelines(pending_balances)
+                    self._bal_fp.flush()
+                    self.balance_counts[index] = self.balance_counts.get(index, 0) + len(pending_balances)
+
+                # Save progress every 5 blocks or 10 seconds
+                last_completed_block = block
+                blocks_since_save += 1
+                now = time.monotonic()
+                if blocks_since_save >= 5 or now - last_progress_flush >= 10:
+                    self.save_progress(block)
+                    last_progress_flush = now
+                    blocks_since_save = 0
+
+                current_block = block + 1
+
         except Exception as e:
             print(f"❌ Error during scanning: {e}")
-        
-        self.is_running = False
+        finally:
+            if blocks_since_save and last_completed_block is not None:
+                self.save_progress(last_completed_block)
+            # Runs on normal completion and on task cancellation alike:
+            # drop any blocks still being prefetched, flush buffers, and
+            # release the HTTP session
+            for task in fetch_tasks.values():
+                task.cancel()
+            self._close_current_files()
+            await self.close()
+            self.is_running = False
+
         return {
             'current_block': current_block,
             'total_addresses': self.total_addresses,
@@ -204,26 +426,44 @@ class BlockchainScanner:
             'current_file_index': self.current_file_index
         }
 
+    @staticmethod
+    def _count_lines(file_path: str) -> int:
+        """Count newlines in 1MB chunks — no per-line Python objects"""
+        with open(file_path, 'rb') as f:
+            return sum(buf.count(b'\n') for buf in iter(lambda: f.read(1 << 20), b''))
+
+    def _invalidate_files_cache(self):
+        """Force the next get_available_files call to rescan the directory"""
+        self._files_cache = (0.0, None)
+
     def get_available_files(self) -> List[Dict]:
         """Get list of all available file pairs"""
+        expiry, cached = self._files_cache
+        if cached is not None and time.monotonic() < expiry:
+            return cached
+
         files = []
-        address_files = glob.glob(os.path.join(self.data_dir, "addresses_*.txt"))
-        
-        for addr_file in address_files:
+
+        for index in sorted(self._scan_file_indices()):
             try:
-                filename = os.path.basename(addr_file)
-                index = int(filename.split('_')[1].split('.')[0])
-                balance_file = f"data/addresses_with_balance_{index}.txt"
-                
-                if os.path.exists(balance_file):
-                    # Count lines in address file
-                    with open(addr_file, 'r') as f:
-                        address_count = len(f.readlines())
-                    
-                    # Count lines in balance file
-                    with open(balance_file, 'r') as f:
-                        balance_count = len(f.readlines())
-                    
+                addr_file, balance_file = self.batch_file_paths(index)
+
+                balance_size = self._file_size(balance_file)
+                if balance_size is not None:
+                    # Use the counters maintained on the write path; fall
+                    # back to file size / streaming count for pre-existing
+                    # files, only reading them when non-empty
+                    address_count = self.address_counts.get(index)
+                    if address_count is None:
+                        addr_size = self._file_size(addr_file)
+                        address_count = self._count_lines(addr_file) if addr_size else 0
+                        self.address_counts[index] = address_count
+
+                    balance_count = self.balance_counts.get(index)
+                    if balance_count is None:
+                        balance_count = self._count_lines(balance_file) if balance_size else 0
+                        self.balance_counts[index] = balance_count
+
                     files.append({
                         'index': index,
                         'address_file': addr_file,
@@ -231,42 +471,60 @@ class BlockchainScanner:
                         'address_count': address_count,
                         'balance_count': balance_count
                     })
-            except (ValueError, IndexError):
+            except OSError:
                 continue
-        
-        return sorted(files, key=lambda x: x['index'])
+
+        self._files_cache = (time.monotonic() + 2.0, files)
+        return files
 
     def delete_files(self, file_index: int):
         """Delete specific file pair"""
         try:
-            addr_file = f"data/addresses_{file_index}.txt"
-            balance_file = f"data/addresses_with_balance_{file_index}.txt"
-            
-            if os.path.exists(addr_file):
-                os.remove(addr_file)
-            if os.path.exists(balance_file):
-                os.remove(balance_file)
-                
+            # Remove directly; catching the miss is cheaper than exists+remove
+            for file_path in self.batch_file_paths(file_index):
+                try:
+                    os.remove(file_path)
+                except FileNotFoundError:
+                    pass
+
+            self.address_counts.pop(file_index, None)
+            self.balance_counts.pop(file_index, None)
+            self.total_file_pairs = max(0, self.total_file_pairs - 1)
+            self._invalidate_files_cache()
+
             print(f"🗑️ Deleted file pair: {file_index}")
             return True
         except Exception as e:
             print(f"❌ Error deleting files {file_index}: {e}")
             return False
 
-    def cleanup_old_files(self, keep_count: int = 5):
+    async def cleanup_old_files(self, keep_count: int = 5):
         """Keep only recent files and delete old ones"""
         try:
             files = self.get_available_files()
             if len(files) <= keep_count:
                 return
-            
+
             # Sort by index and keep only the newest ones
             files.sort(key=lambda x: x['index'])
             files_to_delete = files[:-keep_count]
-            
+
+            # Issue every unlink concurrently off the event loop;
+            # missing files just come back as ignored exceptions
+            paths = []
+            for file_info in files_to_delete:
+                paths.extend(self.batch_file_paths(file_info['index']))
+            await asyncio.gather(
+                *(asyncio.to_thread(os.unlink, path) for path in paths),
+                return_exceptions=True
+            )
+
             for file_info in files_to_delete:
-                self.delete_files(file_info['index'])
-                
+                self.address_counts.pop(file_info['index'], None)
+                self.balance_counts.pop(file_info['index'], None)
+            self.total_file_pairs = max(0, self.total_file_pairs - len(files_to_delete))
+            self._invalidate_files_cache()
+
             print(f"🧹 Cleaned up {len(files_to_delete)} old file pairs")
         except Exception as e:
             print(f"❌ Error cleaning up old files: {e}")
@@ -276,15 +534,12 @@ class BlockchainScanner:
         self.is_running = False
 
     def get_stats(self) -> Dict:
-        """Get current statistics"""
-        files = self.get_available_files()
-        total_files = len(files)
-        
+        """Get current statistics from in-memory counters, no filesystem I/O"""
         return {
             'current_block': self.current_block,
             'total_addresses': self.total_addresses,
             'addresses_with_balance': self.addresses_with_balance,
             'is_running': self.is_running,
             'current_file_index': self.current_file_index,
-            'total_file_pairs': total_files
+            'total_file_pairs': self.total_file_pairs
         }
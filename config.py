@@ -10,6 +10,7 @@ MAX_BLOCKS_PER_RUN = 20
 # API Configuration
 API_DELAY = 2
 MAX_RETRIES = 2
+BALANCE_CACHE_SIZE = int(os.environ.get('BALANCE_CACHE_SIZE', 50000))
 
 # File Management
 MAX_FILES_TO_KEEP = 5
@@ -1,6 +1,6 @@
 import os
+import asyncio
 import logging
-import threading
 from telegram import Update
 from telegram.ext import Application, CommandHandler, ContextTypes
 from blockchain_scanner import BlockchainScanner
@@ -17,7 +17,7 @@ class TelegramBlockchainBot:
         self.token = token
         self.scanner = BlockchainScanner()
         self.application = Application.builder().token(token).build()
-        self.scanning_thread = None
+        self.scan_task = None
         
         # Setup handlers
         self.setup_handlers()
@@ -93,30 +93,39 @@ class TelegramBlockchainBot:
         """Download current file batch"""
         try:
             current_index = self.scanner.current_file_index
-            addr_file = f"data/addresses_{current_index}.txt"
-            balance_file = f"data/addresses_with_balance_{current_index}.txt"
-            
-            if not os.path.exists(addr_file) or os.path.getsize(addr_file) == 0:
+            addr_file, balance_file = self.scanner.batch_file_paths(current_index)
+
+            # One stat covers both the existence and the size check
+            try:
+                addr_size = os.path.getsize(addr_file)
+            except OSError:
+                addr_size = 0
+
+            if addr_size == 0:
                 await update.message.reply_text("❌ No addresses collected in current batch yet!")
                 return
             
-            # Send address file
-            with open(addr_file, 'rb') as f:
+            # Pass the path so PTB streams the upload instead of
+            # buffering the whole file in memory
+            await update.message.reply_document(
+                document=addr_file,
+                filename=f'addresses_{current_index}.txt',
+                caption=f'📄 Addresses Batch {current_index}'
+            )
+
+            # Send balance file if it has content
+            try:
+                balance_size = os.path.getsize(balance_file)
+            except OSError:
+                balance_size = 0
+
+            if balance_size > 0:
                 await update.message.reply_document(
-                    document=f,
-                    filename=f'addresses_{current_index}.txt',
-                    caption=f'📄 Addresses Batch {current_index}'
+                    document=balance_file,
+                    filename=f'addresses_with_balance_{current_index}.txt',
+                    caption=f'💰 Addresses with Balance Batch {current_index}'
                 )
             
-            # Send balance file if it has content
-            if os.path.exists(balance_file) and os.path.getsize(balance_file) > 0:
-                with open(balance_file, 'rb') as f:
-                    await update.message.reply_document(
-                        document=f,
-                        filename=f'addresses_with_balance_{current_index}.txt',
-                        caption=f'💰 Addresses with Balance Batch {current_index}'
-                    )
-            
             # Create new files for next batch
             new_index = self.scanner.create_new_files()
             await update.message.reply_text(
@@ -135,29 +144,31 @@ class TelegramBlockchainBot:
                 return
             
             file_index = int(context.args[0])
-            addr_file = f"data/addresses_{file_index}.txt"
-            balance_file = f"data/addresses_with_balance_{file_index}.txt"
-            
+            addr_file, balance_file = self.scanner.batch_file_paths(file_index)
+
             if not os.path.exists(addr_file):
                 await update.message.reply_text(f"❌ Batch {file_index} not found!")
                 return
             
-            # Send address file
-            with open(addr_file, 'rb') as f:
+            # Send address file (path, so PTB streams the upload)
+            await update.message.reply_document(
+                document=addr_file,
+                filename=f'addresses_{file_index}.txt',
+                caption=f'📄 Addresses Batch {file_index}'
+            )
+
+            # Send balance file if it exists and has content (one stat)
+            try:
+                balance_size = os.path.getsize(balance_file)
+            except OSError:
+                balance_size = 0
+
+            if balance_size > 0:
                 await update.message.reply_document(
-                    document=f,
-                    filename=f'addresses_{file_index}.txt',
-                    caption=f'📄 Addresses Batch {file_index}'
+                    document=balance_file,
+                    filename=f'addresses_with_balance_{file_index}.txt',
+                    caption=f'💰 Addresses with Balance Batch {file_index}'
                 )
-            
-            # Send balance file if it exists
-            if os.path.exists(balance_file) and os.path.getsize(balance_file) > 0:
-                with open(balance_file, 'rb') as f:
-                    await update.message.reply_document(
-                        document=f,
-                        filename=f'addresses_with_balance_{file_index}.txt',
-                        caption=f'💰 Addresses with Balance Batch {file_index}'
-                    )
                 
         except ValueError:
             await update.message.reply_text("❌ Please provide a valid number!")
@@ -168,29 +179,28 @@ class TelegramBlockchainBot:
         """Clean up old files"""
         try:
             keep_count = int(context.args[0]) if context.args else 5
-            self.scanner.cleanup_old_files(keep_count)
-            
-            files = self.scanner.get_available_files()
+            await self.scanner.cleanup_old_files(keep_count)
+
             await update.message.reply_text(
                 f"🧹 Cleanup completed!\n"
                 f"Keeping last {keep_count} batches.\n"
-                f"Remaining: {len(files)} batches"
+                f"Remaining: {self.scanner.total_file_pairs} batches"
             )
         except Exception as e:
             await update.message.reply_text(f"❌ Error: {str(e)}")
 
-    def scan_blocks_thread(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Run scanning in separate thread"""
+    async def _run_scan(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Run a scan as a task on the bot's event loop"""
         try:
             start_block = self.scanner.load_progress()
-            
-            context.bot.send_message(
+
+            await context.bot.send_message(
                 chat_id=update.effective_chat.id,
                 text=f"🚀 Starting scan from block {start_block}..."
             )
-            
-            result = self.scanner.scan_blocks(start_block)
-            
+
+            result = await self.scanner.scan_blocks(start_block)
+
             completion_text = f"""
 ✅ **Scanning Completed**
 
@@ -202,39 +212,41 @@ class TelegramBlockchainBot:
 Use /start_scan to continue
 Use /get_files to download
             """
-            context.bot.send_message(
+            await context.bot.send_message(
                 chat_id=update.effective_chat.id,
                 text=completion_text,
                 parse_mode='Markdown'
             )
+        except asyncio.CancelledError:
+            # Scanner buffers are flushed in scan_blocks' cleanup path
+            await context.bot.send_message(
+                chat_id=update.effective_chat.id,
+                text="🛑 Scanning stopped"
+            )
         except Exception as e:
-            context.bot.send_message(
+            await context.bot.send_message(
                 chat_id=update.effective_chat.id,
                 text=f"❌ Scanning error: {str(e)}"
             )
 
     async def start_scan_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Start scanning blocks"""
-        if self.scanner.is_running:
+        if self.scan_task is not None and not self.scan_task.done():
             await update.message.reply_text("⚠️ Already scanning!")
             return
-        
-        self.scanning_thread = threading.Thread(
-            target=self.scan_blocks_thread,
-            args=(update, context)
-        )
-        self.scanning_thread.daemon = True
-        self.scanning_thread.start()
-        
+
+        self.scan_task = asyncio.create_task(self._run_scan(update, context))
+
         await update.message.reply_text("🔍 Starting scan... (20 blocks)")
 
     async def stop_scan_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Stop scanning"""
-        if not self.scanner.is_running:
+        if self.scan_task is None or self.scan_task.done():
             await update.message.reply_text("ℹ️ No active scanning")
             return
-        
+
         self.scanner.stop_scanning()
+        self.scan_task.cancel()
         await update.message.reply_text("🛑 Stopping...")
 
     def run(self):